@@ -9,11 +9,14 @@ Copyright (c) 2026 fr0stb1rd
 """
 
 import os
+import io
 import sys
 import argparse
 import asyncio
 import logging
 import shutil
+import sqlite3
+import struct
 import subprocess
 import numpy as np
 import librosa
@@ -25,11 +28,14 @@ import numpy.typing as npt
 from tqdm import tqdm
 import warnings
 import random
+import xxhash
+import av
+import soxr
 # Suppress pydub SyntaxWarning in Python 3.12+ (invalid escape sequence)
 warnings.filterwarnings("ignore", category=SyntaxWarning, module="pydub")
 
 from pathlib import Path
-from audiostretchy.stretch import stretch_audio
+from numba import njit
 
 def print_banner():
     """Print application banner with project information."""
@@ -83,13 +89,101 @@ OVERLAP_THRESHOLD = 0.01  # Seconds - threshold for detecting subtitle overlap
 MIN_SEGMENT_DURATION = 0.05  # Seconds - minimum duration for late-start segments
 FINAL_PADDING_THRESHOLD = 0.01  # Seconds - threshold for adding final padding
 EXCESS_AUDIO_WARNING_THRESHOLD = 1.0  # Seconds - threshold for warning about excess audio
+STRETCH_FRAME = 1024  # Samples - analysis frame for time-stretch (~43ms at 24kHz)
+STRETCH_OVERLAP = 256  # Samples - waveform-similarity search range for time-stretch
+
+@njit(cache=True, fastmath=True, boundscheck=False)
+def _tdhs_stretch_into(y: np.ndarray, out: np.ndarray, ratio: float, frame: int, overlap: int) -> None:
+    """Time-domain harmonic scaling (WSOLA) stretch of a mono float32 buffer.
+
+    Overlap-adds Hann-windowed frames at an output hop of frame/2, picking
+    each frame's input position by cross-correlation within +/-overlap
+    samples of the nominal position so phases line up across the seam.
+    Writes directly into the caller's zero-initialized buffer: output is
+    capped at len(out) (crop for free) and any unwritten tail stays zero
+    (padding for free), so no separate pad/crop pass or intermediate
+    allocation is needed. Compiled with Numba; the first call pays the
+    JIT cost (cached on disk).
+
+    Args:
+        y: Mono audio as float32 array
+        out: Zero-initialized float32 output buffer, written in place
+        ratio: Output/input length ratio (>1 slows down, <1 speeds up)
+        frame: Analysis frame length in samples
+        overlap: Similarity search range in samples
+    """
+    n_in = y.shape[0]
+    n_out = out.shape[0]
+    hop = frame // 2
+
+    # Too short to window, or no stretch requested: copy through
+    if n_in < frame + 2 * overlap + hop or n_out < frame:
+        m = n_in if n_in < n_out else n_out
+        for i in range(m):
+            out[i] = y[i]
+        return
+
+    # Hann window; 50% overlap-add sums to unity away from the edges
+    win = np.empty(frame, dtype=np.float32)
+    for i in range(frame):
+        win[i] = np.float32(0.5 - 0.5 * np.cos(2.0 * np.pi * i / (frame - 1)))
+
+    n_frames = (n_out - frame) // hop + 1
+
+    # First frame is anchored at the input start
+    for i in range(frame):
+        out[i] = y[i] * win[i]
+    prev = 0
+
+    for k in range(1, n_frames):
+        nominal = int(k * hop / ratio)
+        if nominal > n_in - frame:
+            nominal = n_in - frame
+        lo = nominal - overlap
+        if lo < 0:
+            lo = 0
+        hi = nominal + overlap
+        if hi > n_in - frame:
+            hi = n_in - frame
+        if lo > hi:
+            lo = hi
+
+        # Template is the natural continuation of the previous frame
+        t0 = prev + hop
+        if t0 > n_in - frame:
+            t0 = n_in - frame
+
+        best = lo
+        best_corr = np.float32(-1e30)
+        for cand in range(lo, hi + 1):
+            corr = np.float32(0.0)
+            for i in range(frame):
+                corr += y[t0 + i] * y[cand + i]
+            if corr > best_corr:
+                best_corr = corr
+                best = cand
+
+        o = k * hop
+        for i in range(frame):
+            j = o + i
+            if j < n_out:
+                out[j] += y[best + i] * win[i]
+        prev = best
+
+# Warm the JIT cache at import so the first real segment doesn't pay
+# the compile cost (takes the copy-through path, still compiles).
+_tdhs_stretch_into(np.zeros(8, dtype=np.float32), np.zeros(8, dtype=np.float32),
+                   1.0, STRETCH_FRAME, STRETCH_OVERLAP)
 
 def get_media_duration(file_path: Optional[str]) -> float:
-    """Get duration of a media file using ffprobe.
-    
+    """Get duration of a media file using an in-process libav probe.
+
+    Reads the container header via PyAV instead of forking an ffprobe
+    subprocess, which also drops the external-binary requirement.
+
     Args:
         file_path: Path to media file
-        
+
     Returns:
         Duration in seconds, or 0.0 if file not found or error occurs
     """
@@ -99,23 +193,17 @@ def get_media_duration(file_path: Optional[str]) -> float:
     if not os.path.exists(file_path):
         logger.error(f"Media file not found: {file_path}")
         return 0.0
-    cmd = [
-        "ffprobe", "-v", "error", "-show_entries", "format=duration", 
-        "-of", "default=noprint_wrappers=1:nokey=1", file_path
-    ]
     try:
-        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
-        duration = float(result.stdout.strip())
+        with av.open(file_path) as container:
+            if container.duration is None:
+                logger.error(f"No duration in container metadata for {file_path}")
+                return 0.0
+            duration = float(container.duration) / av.time_base
         logger.debug(f"Media duration for {os.path.basename(file_path)}: {duration:.2f}s")
         return duration
-    except FileNotFoundError:
-        logger.error("ffprobe not found. Please install FFmpeg and ensure it's in PATH.")
-        return 0.0
-    except subprocess.CalledProcessError as e:
-        logger.error(f"ffprobe failed for {file_path}: {e.stderr}")
-        return 0.0
-    except ValueError as e:
-        logger.error(f"Invalid duration value from ffprobe: {e}")
+    except OSError as e:
+        # PyAV raises FFmpegError (an OSError subclass) for unreadable containers
+        logger.error(f"Failed to probe {file_path}: {e}")
         return 0.0
     except Exception as e:
         logger.error(f"Unexpected error reading duration for {file_path}: {e}")
@@ -148,60 +236,128 @@ def parse_duration_str(duration_str: Optional[str]) -> float:
         return 0.0
     return 0.0
 
-def convert_audio_format(input_path: str, output_path: str, format: str) -> bool:
-    """Convert audio file to specified format using ffmpeg.
-    
-    Args:
-        input_path: Path to source audio file
-        output_path: Path to destination file
-        format: Target format (m4a, opus, wav)
-        
-    Returns:
-        True if successful, False otherwise
+class _FfmpegStreamWriter:
+    """Streams float32 PCM into an ffmpeg encode process chunk by chunk.
+
+    Feeds ffmpeg's stdin as segments are produced, so encoding overlaps
+    with stretching and no intermediate WAV (or whole-output buffer) ever
+    exists. Write errors are latched and reported by close() so one
+    broken pipe doesn't abort the run mid-stream.
     """
-    try:
+
+    def __init__(self, output_path: str, sample_rate: int, format: str) -> None:
         if format == 'm4a':
             # AAC encoding for M4A
-            cmd = ["ffmpeg", "-i", input_path, "-c:a", "aac", "-b:a", "192k", "-y", output_path]
-        elif format == 'opus':
-            # Opus encoding
-            cmd = ["ffmpeg", "-i", input_path, "-c:a", "libopus", "-b:a", "128k", "-y", output_path]
+            codec = ["-c:a", "aac", "-b:a", "192k"]
         else:
-            # Default or WAV, just copy
-            cmd = ["ffmpeg", "-i", input_path, "-y", output_path]
-            
-        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        return True
-    except Exception as e:
-        logger.error(f"Failed to convert audio to {format}: {e}")
-        return False
+            # Opus encoding
+            codec = ["-c:a", "libopus", "-b:a", "128k"]
+        cmd = ["ffmpeg", "-f", "f32le", "-ar", str(sample_rate), "-ac", "1", "-i", "-",
+               *codec, "-y", output_path]
+        self._format = format
+        self._failed = False
+        self._proc = None
+        try:
+            self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE,
+                                          stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        except Exception as e:
+            # Typically ffmpeg missing from PATH; latch and let close()
+            # report the failure instead of crashing mid-run
+            logger.error(f"Failed to start ffmpeg for {format} encoding: {e}")
+            self._failed = True
+
+    def write(self, chunk: npt.NDArray[np.float32]) -> None:
+        if self._failed:
+            return
+        try:
+            self._proc.stdin.write(np.ascontiguousarray(chunk, dtype=np.float32).tobytes())
+        except Exception as e:
+            logger.error(f"Failed to stream audio to ffmpeg: {e}")
+            self._failed = True
+
+    def close(self) -> bool:
+        if self._proc is None:
+            return False
+        try:
+            self._proc.stdin.close()
+        except Exception:
+            pass
+        if self._proc.wait() != 0:
+            logger.error(f"ffmpeg exited with code {self._proc.returncode} encoding {self._format}")
+            return False
+        return not self._failed
+
+def decode_audio_bytes(data: bytes) -> tuple[npt.NDArray[np.float32], int]:
+    """Decode a compressed audio stream to mono float32 in-process via PyAV.
+
+    Runs ffmpeg's lavc decoder in this process with threaded decoding,
+    so there is no per-call subprocess fork the way audioread does it.
 
-def time_str_to_seconds(t_obj) -> float:
-    """Convert pysrt time object to seconds.
-    
     Args:
-        t_obj: pysrt SubRipTime object
-        
+        data: Encoded audio bytes (the MP3 stream from Edge TTS)
+
     Returns:
-        Time in seconds as float
+        Tuple of (mono float32 samples, native sample rate)
     """
-    return t_obj.hours * 3600 + t_obj.minutes * 60 + t_obj.seconds + t_obj.milliseconds / 1000.0
+    with av.open(io.BytesIO(data)) as container:
+        stream = container.streams.audio[0]
+        stream.thread_type = 'AUTO'
+        sr = stream.rate
+        chunks = []
+        for frame in container.decode(stream):
+            arr = frame.to_ndarray()
+            if np.issubdtype(arr.dtype, np.integer):
+                arr = arr.astype(np.float32) / np.float32(np.iinfo(arr.dtype).max + 1)
+            else:
+                arr = arr.astype(np.float32)
+            if arr.ndim > 1:
+                if frame.format.is_planar:
+                    # Planar frames come out as (channels, samples)
+                    arr = arr.mean(axis=0) if arr.shape[0] > 1 else arr[0]
+                else:
+                    # Packed frames come out as (1, samples * channels)
+                    # with the channels interleaved
+                    arr = arr[0]
+                    n_channels = len(frame.layout.channels)
+                    if n_channels > 1:
+                        arr = arr.reshape(-1, n_channels).mean(axis=1)
+            chunks.append(arr)
+    if not chunks:
+        return np.zeros(0, dtype=np.float32), sr
+    return np.concatenate(chunks), sr
 
-async def generate_audio_segment(text: str, output_file: str, voice: str, rate: str = "+0%", retries: int = 10) -> None:
+async def generate_audio_segment(text: str, voice: str, rate: str = "+0%", retries: int = 10) -> bytes:
     """Generates audio for a single text segment using Edge TTS with retry logic.
-    
+
+    Streams the TTS response in memory and returns the segment as 24kHz
+    PCM WAV bytes, so the MP3 that Edge TTS insists on sending is decoded
+    exactly once here instead of once per downstream read.
+
     Args:
         text: Text content to convert to speech
-        output_file: Path where audio file will be saved
         voice: Edge TTS voice name (e.g., 'en-US-JennyNeural')
         rate: Speech rate adjustment (e.g., '+0%', '+10%', '-10%')
         retries: Number of retry attempts for network failures
+
+    Returns:
+        The generated audio as 16-bit 24kHz mono WAV bytes
     """
     for i in range(retries + 1):
         try:
             communicate = edge_tts.Communicate(text, voice, rate=rate)
-            await communicate.save(output_file)
-            return
+            audio_bytes = bytearray()
+            async for chunk in communicate.stream():
+                if chunk["type"] == "audio":
+                    audio_bytes.extend(chunk["data"])
+            if not audio_bytes:
+                raise RuntimeError("Edge TTS returned no audio data")
+            # Decode the MP3 stream once and keep plain PCM
+            y, sr = decode_audio_bytes(bytes(audio_bytes))
+            if sr != SAMPLE_RATE:
+                y = resample_audio(y, sr, SAMPLE_RATE)
+            buf = io.BytesIO()
+            sf.write(buf, y.astype(np.float32), SAMPLE_RATE, format='WAV', subtype='PCM_16')
+            return buf.getvalue()
         except Exception as e:
             if i < retries:
                 wait_time = (i + 1) * random.uniform(1, 3)
@@ -215,122 +371,244 @@ async def generate_audio_segment(text: str, output_file: str, voice: str, rate:
 async def generate_audio_batch(
     segments_info: list[tuple[str, str, int]],
     voice: str,
+    conn: sqlite3.Connection,
     batch_size: int = 10,
     retries: int = 10
 ) -> dict[int, Optional[Exception]]:
-    """Generate multiple audio segments in parallel using async batch processing.
-    
+    """Generate multiple audio segments concurrently with bounded parallelism.
+
+    A semaphore caps in-flight requests at batch_size, but unlike fixed
+    batches there is no wait for a batch's slowest request — a freed slot
+    immediately picks up the next segment, so the API stays saturated.
+    Generated WAV bytes go straight into the blob cache and each insert
+    is committed immediately (cheap under WAL), so an interrupted run
+    keeps everything generated so far and the rerun resumes from there.
+    All tasks run on the event-loop thread, so sharing one connection is
+    safe.
+
     Args:
-        segments_info: List of tuples (text, output_path, segment_index)
+        segments_info: List of tuples (text, text_hash, segment_index)
         voice: Edge TTS voice name
-        batch_size: Number of concurrent requests (default: 10)
-        
+        conn: Open connection to the segment blob cache
+        batch_size: Maximum number of concurrent requests (default: 10)
+
     Returns:
         Dictionary mapping segment index to Exception (if failed) or None (if success)
     """
-    async def generate_one(text: str, output_path: str, index: int) -> tuple[int, Optional[Exception]]:
+    semaphore = asyncio.Semaphore(batch_size)
+    done_count = 0
+
+    async def generate_one(text: str, text_hash: str, index: int) -> tuple[int, Optional[Exception]]:
+        nonlocal done_count
+        async with semaphore:
+            try:
+                wav_bytes = await generate_audio_segment(text, voice, retries=retries)
+                conn.execute("INSERT OR REPLACE INTO cache(h, data) VALUES (?, ?)",
+                             (text_hash, wav_bytes))
+                # Commit per segment so an interrupted run persists
+                # everything generated so far (the resume guarantee)
+                conn.commit()
+                result = (index, None)
+            except Exception as e:
+                result = (index, e)
+        done_count += 1
+        if done_count % 50 == 0 or done_count == len(segments_info):
+            logger.info(f"  Generated {done_count}/{len(segments_info)} segments...")
+        return result
+
+    tasks = [generate_one(text, text_hash, idx) for text, text_hash, idx in segments_info]
+    results = await asyncio.gather(*tasks, return_exceptions=False)
+    return {idx: error for idx, error in results}
+
+def resample_audio(y: npt.NDArray[np.float32], orig_sr: int, target_sr: int) -> npt.NDArray[np.float32]:
+    """Resample mono audio with soxr's C resampler.
+
+    Goes straight to soxr (the backend librosa.resample dispatches to by
+    default anyway), skipping librosa's per-call validation and filter
+    setup — the same C kernel then serves every segment. librosa remains
+    the fallback if soxr rejects the input.
+
+    Args:
+        y: Mono float32 audio
+        orig_sr: Source sample rate in Hz
+        target_sr: Target sample rate in Hz
+
+    Returns:
+        Resampled mono float32 audio
+    """
+    try:
+        return soxr.resample(y, orig_sr, target_sr, quality='HQ').astype(np.float32, copy=False)
+    except Exception as e:
+        logger.debug(f"soxr resample failed ({e}), falling back to librosa")
+        return librosa.resample(y, orig_sr=orig_sr, target_sr=target_sr)
+
+class _WavStreamWriter:
+    """Incremental 16-bit PCM WAV writer built on raw os.write calls.
+
+    Packs the 44-byte RIFF header by hand (skipping libsndfile's internal
+    buffering and chunked copy pass) but streams the data chunk block by
+    block as segments are produced: the header goes out with placeholder
+    sizes and is patched in place on close, so the full output never has
+    to exist in memory.
+    """
+
+    def __init__(self, path: str, sample_rate: int) -> None:
+        self._sample_rate = sample_rate
+        self._n_bytes = 0
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.write(self._fd, self._header())
+
+    def _header(self) -> bytes:
+        return struct.pack('<4sI4s4sIHHIIHH4sI',
+                           b'RIFF', 36 + self._n_bytes, b'WAVE',
+                           b'fmt ', 16, 1, 1, self._sample_rate,
+                           self._sample_rate * 2, 2, 16,
+                           b'data', self._n_bytes)
+
+    def write(self, chunk: npt.NDArray[np.float32]) -> None:
+        pcm = np.ascontiguousarray((np.clip(chunk, -1.0, 1.0) * 32767.0).astype('<i2'))
+        os.write(self._fd, memoryview(pcm))
+        self._n_bytes += pcm.nbytes
+
+    def close(self) -> bool:
         try:
-            await generate_audio_segment(text, output_path, voice, retries=retries)
-            return (index, None)
-        except Exception as e:
-            return (index, e)
-    
-    all_results = {}
-    
-    # Process in batches to avoid overwhelming the API
-    for i in range(0, len(segments_info), batch_size):
-        batch = segments_info[i:i + batch_size]
-        batch_num = (i // batch_size) + 1
-        total_batches = (len(segments_info) + batch_size - 1) // batch_size
-        
-        logger.info(f"  Processing batch {batch_num}/{total_batches} ({len(batch)} segments)...")
-        
-        # Generate batch in parallel
-        tasks = [generate_one(text, path, idx) for text, path, idx in batch]
-        results = await asyncio.gather(*tasks, return_exceptions=False)
-        
-        # Collect results
-        for idx, error in results:
-            all_results[idx] = error
-    
-    return all_results
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            os.write(self._fd, self._header())
+        finally:
+            os.close(self._fd)
+        return True
+
+def load_audio(source, sample_rate: int = SAMPLE_RATE) -> npt.NDArray[np.float32]:
+    """Load audio as mono float32 at the given sample rate.
+
+    Reads via soundfile directly and only resamples when the native rate
+    differs from the target — Edge TTS already outputs 24kHz, so the
+    common case skips librosa's polyphase resample entirely. Falls back to
+    librosa.load for formats libsndfile can't open.
+
+    Args:
+        source: Path to an audio file, or a file-like object (e.g. a
+            BytesIO over a cached WAV blob)
+        sample_rate: Target sample rate in Hz
+
+    Returns:
+        Mono audio as numpy float32 array at the target sample rate
+    """
+    try:
+        y, sr = sf.read(source, dtype='float32', always_2d=False)
+        if y.ndim > 1:
+            y = y.mean(axis=1)
+    except Exception as e:
+        # libsndfile couldn't read it (e.g. MP3 on older builds)
+        logger.debug(f"soundfile failed for {source} ({e}), falling back to librosa")
+        if hasattr(source, 'seek'):
+            source.seek(0)
+        return librosa.load(source, sr=sample_rate)[0]
+
+    if sr != sample_rate:
+        y = resample_audio(y, sr, sample_rate)
+    return np.ascontiguousarray(y, dtype=np.float32)
 
 def adjust_audio_length(
-    wav_path: str, 
-    desired_length: float, 
-    sample_rate: int = SAMPLE_RATE, 
+    source,
+    target_samples: int,
+    sample_rate: int = SAMPLE_RATE,
     max_speed_factor: float = 1.5
 ) -> npt.NDArray[np.float32]:
-    """Adjusts audio file to desired length using audiostretchy time-stretching.
-    
+    """Adjusts audio to an exact sample count via WSOLA time-stretching.
+
+    Allocates the target buffer zeroed and lets the stretch kernel write
+    straight into it: the kernel caps its output at target_samples and
+    leaves any unwritten tail as silence, so there is no intermediate
+    stretched array and no separate pad/crop pass.
+
     Args:
-        wav_path: Path to input audio file (MP3 or WAV)
-        desired_length: Target duration in seconds
+        source: Path to an audio file, or a file-like object over WAV bytes
+        target_samples: Exact output length in samples
         sample_rate: Audio sample rate in Hz
         max_speed_factor: Maximum speed-up factor (e.g., 2.0 = 2x speed)
-        
+
     Returns:
-        Adjusted audio as numpy float32 array at specified sample rate
-        
-    Note:
-        Uses high-quality time-stretching algorithm. Automatically cleans up
-        temporary files. Returns original audio if stretching fails.
+        Adjusted audio as numpy float32 array of exactly target_samples
+        samples, even on failure (silence if the file can't be read) —
+        callers can rely on the length without inspecting the audio.
     """
+    out = np.zeros(max(target_samples, 0), dtype=np.float32)
+
     try:
         # Load original
-        y, sr = librosa.load(wav_path, sr=sample_rate)
+        y = load_audio(source, sample_rate)
     except Exception as e:
-        logger.error(f"Failed to load {wav_path}: {e}")
-        return np.zeros(0, dtype=np.float32)
+        logger.error(f"Failed to load segment audio: {e}")
+        return out
 
-    current_length = len(y) / sample_rate
-    
-    if desired_length <= 0:
+    if target_samples <= 0:
         return y
+    if len(y) == 0:
+        return out
 
     # Calculate time-stretching ratio
-    # audiostretchy ratio: >1 slows down, <1 speeds up
-    # ratio = desired_duration / current_duration
-    ratio = desired_length / current_length
-    
+    # ratio: >1 slows down, <1 speeds up
+    ratio = target_samples / len(y)
+
     # Clamp ratio to prevent excessive speed-up
     # max_speed 2.0x means minimum ratio of 0.5
     min_ratio = 1.0 / max_speed_factor
     if ratio < min_ratio:
         ratio = min_ratio
-        logger.warning(f"  Clamped max speed: Ratio {ratio:.3f} (Req: {desired_length:.2f}s from {current_length:.2f}s)")
-    
-    input_tmp = wav_path
-    output_tmp = wav_path.replace(".mp3", "_stretched.wav").replace(".wav", "_stretched.wav")
-    
+        logger.warning(f"  Clamped max speed: Ratio {ratio:.3f} "
+                       f"(Req: {target_samples / sample_rate:.2f}s from {len(y) / sample_rate:.2f}s)")
+
     try:
-        stretch_audio(input_tmp, output_tmp, ratio=ratio, sample_rate=sample_rate)
-        # Load the result
-        y_stretched, _ = librosa.load(output_tmp, sr=sample_rate)
-        
-        # Trim or Pad to EXACT desired sample count to avoid drift
-        target_samples = int(desired_length * sample_rate)
-        
-        if len(y_stretched) < target_samples:
-            # Pad
-            padding = target_samples - len(y_stretched)
-            y_stretched = np.pad(y_stretched, (0, padding), 'constant')
-        elif len(y_stretched) > target_samples:
-            # Crop
-            y_stretched = y_stretched[:target_samples]
-            
-        return y_stretched
-        
+        # Stretch in memory with the JIT-compiled WSOLA kernel
+        _tdhs_stretch_into(np.ascontiguousarray(y, dtype=np.float32), out,
+                           ratio, STRETCH_FRAME, STRETCH_OVERLAP)
+        return out
     except Exception as e:
-        logger.error(f"Stretching failed: {e}")
-        return y
-    finally:
-        # Clean up temporary stretched file
-        if os.path.exists(output_tmp):
-            try:
-                os.remove(output_tmp)
-            except Exception as e:
-                logger.warning(f"Failed to remove temp file {output_tmp}: {e}")
+        logger.error(f"Stretching failed ({e}), falling back to librosa time_stretch")
+
+    try:
+        # Fall back to librosa's phase-vocoder stretch on the same buffer
+        y_stretched = librosa.effects.time_stretch(y, rate=1.0 / ratio)
+    except Exception as e:
+        logger.error(f"Fallback stretch failed: {e}")
+        y_stretched = y
+
+    # Still honor the exact-length contract
+    n = min(len(y_stretched), target_samples)
+    out[:n] = y_stretched[:n]
+    return out
+
+# Per-worker-process cache connection, opened lazily on first job
+_worker_conn: Optional[sqlite3.Connection] = None
+
+def _process_segment(job: tuple[int, str, str, int, float]) -> tuple[int, npt.NDArray[np.float32]]:
+    """Stretch one segment to its target length (process-pool worker).
+
+    Fetches the segment's WAV blob from the cache database (each worker
+    process keeps its own read connection; WAL mode allows concurrent
+    readers) and stretches it. Top-level so it pickles cleanly for
+    ProcessPoolExecutor.
+
+    Args:
+        job: Tuple of (segment_index, cache_db_path, text_hash,
+            target_samples, max_speed)
+
+    Returns:
+        Tuple of (segment_index, stretched audio array)
+    """
+    global _worker_conn
+    idx, cache_db_path, text_hash, target_samples, max_speed_factor = job
+    if _worker_conn is None:
+        _worker_conn = sqlite3.connect(cache_db_path)
+    row = _worker_conn.execute("SELECT data FROM cache WHERE h = ?", (text_hash,)).fetchone()
+    if row is None:
+        logger.debug(f"No cached audio for segment {idx}, using silence")
+        return idx, np.zeros(max(target_samples, 0), dtype=np.float32)
+    return idx, adjust_audio_length(
+        io.BytesIO(row[0]), target_samples,
+        sample_rate=SAMPLE_RATE, max_speed_factor=max_speed_factor
+    )
 
 def srt_to_audio_numpy(
     srt_path: str,
@@ -351,7 +629,8 @@ def srt_to_audio_numpy(
     """Convert SRT subtitles to synchronized audio using Edge TTS.
     
     Main processing function with sample-accurate synchronization using Numpy/Librosa.
-    Optimized for long files using list-based accumulation buffer.
+    Segments are stretched in parallel and streamed to the output file in
+    timeline order, so memory use stays bounded regardless of run length.
     
     Args:
         srt_path: Path to input SRT subtitle file
@@ -359,7 +638,8 @@ def srt_to_audio_numpy(
         voice: Edge TTS voice name (e.g., 'en-US-JennyNeural')
         temp_dir: Custom temporary directory (auto-generated if None)
         keep_temp: If True, preserve temporary files after completion
-        resume: If True, resume from existing temp files
+        resume: Kept for compatibility; reuse of previously generated
+            audio is automatic via the persistent text cache
         ref_video: Path to reference video for duration matching
         expected_duration: Target duration as "HH:MM:SS" or seconds string
         max_speed: Maximum speed-up factor (e.g., 1.5 = 1.5x speed max)
@@ -391,10 +671,9 @@ def srt_to_audio_numpy(
 
     # Prepare temp dir
     if not temp_dir:
-        import hashlib
         with open(srt_path, 'rb') as f:
             file_content = f.read()
-        h = hashlib.md5(file_content).hexdigest()
+        h = xxhash.xxh64_hexdigest(file_content)
         temp_dir = os.path.join(os.getcwd(), "temp", h)
     
     if not os.path.exists(temp_dir):
@@ -423,32 +702,44 @@ def srt_to_audio_numpy(
         return
     
     logger.info(f"Loaded {len(subs)} subtitle entries")
-    
-    # Use a list to store chunks, avoiding O(N^2) copying
-    audio_segments = []
+
     current_total_samples = 0
-    
+
     # Determine Final Target Duration
     final_target_sec = 0.0
     if expected_duration:
         final_target_sec = parse_duration_str(expected_duration)
     elif ref_video:
         final_target_sec = get_media_duration(ref_video)
-        
+
+    # Vectorize subtitle timing once: pysrt's SubRipTime.ordinal is the
+    # time in milliseconds, so two np.fromiter passes replace the repeated
+    # per-subtitle attribute arithmetic, and integer sample positions
+    # avoid float seconds<->samples rounding drift in the planning loop.
+    n_subs = len(subs)
+    start_samples = (np.fromiter((s.start.ordinal for s in subs),
+                                 dtype=np.int64, count=n_subs) * SAMPLE_RATE) // 1000
+    end_samples = (np.fromiter((s.end.ordinal for s in subs),
+                               dtype=np.int64, count=n_subs) * SAMPLE_RATE) // 1000
+
     logger.info(f"Final Target Duration: {final_target_sec}s")
     logger.info(f"Starting processing of {len(subs)} subtitle segments...")
     logger.info("="*60)
     
-    # Create cache directory for text-based caching
-    cache_dir = os.path.join(temp_dir, "cache")
-    if not os.path.exists(cache_dir):
-        os.makedirs(cache_dir, exist_ok=True)
-    
+    # Single-file blob cache for generated audio, keyed by text hash.
+    # One sqlite file replaces the old cache/ directory of thousands of
+    # tiny WAVs — far cheaper to enumerate and clean up, and workers can
+    # read blobs concurrently thanks to WAL mode.
+    cache_db_path = os.path.join(temp_dir, "cache.sqlite")
+    conn = sqlite3.connect(cache_db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS cache(h TEXT PRIMARY KEY, data BLOB)")
+    conn.commit()
+
     # Statistics tracking
     stats = {
         'total': len(subs),
         'generated': 0,
-        'resumed': 0,
         'cached': 0,
         'failed': 0,
         'empty': 0,
@@ -456,198 +747,204 @@ def srt_to_audio_numpy(
         'late_starts': 0
     }
     
-    # First pass: Collect segments that need generation
-    segments_to_generate = []  # List of (text, output_path, segment_index)
-    text_to_cache = {}  # Map text hash to cache path for deduplication
-    
-    for i, sub in enumerate(subs):
-        text = sub.text.replace('\n', ' ').strip()
-        if text == "...":
-            text = ""
-        if not text:
-            stats['empty'] += 1
-            continue
-            
-        raw_audio_path = os.path.join(temp_dir, f"raw_{i}.mp3")
-        exists = os.path.exists(raw_audio_path) and os.path.getsize(raw_audio_path) > 0
-        
-        if resume and exists:
-            stats['resumed'] += 1
-        else:
-            # Check cache for this text
-            import hashlib
-            text_hash = hashlib.md5(text.lower().encode('utf-8')).hexdigest()
-            cache_path = os.path.join(cache_dir, f"cache_{text_hash}.mp3")
-            
-            if os.path.exists(cache_path) and os.path.getsize(cache_path) > 0:
-                # Use cached audio
-                try:
-                    import shutil
-                    shutil.copy2(cache_path, raw_audio_path)
-                    stats['cached'] += 1
-                    logger.debug(f"Using cached audio for segment {i} (hash: {text_hash[:8]}...)")
-                except Exception as e:
-                    logger.warning(f"Failed to copy cache for segment {i}: {e}")
-                    # Fall through to generation
-                    if text not in text_to_cache:
-                        text_to_cache[text] = cache_path
-                        segments_to_generate.append((text, cache_path, i))
-            else:
-                # Need to generate and cache
-                if text not in text_to_cache:
-                    text_to_cache[text] = cache_path
-                    segments_to_generate.append((text, cache_path, i))
-    
+    # Snapshot the cache keys with one query: existence checks in the
+    # loop below become set lookups. A rerun over the same temp dir gets
+    # every previously generated text from here, so resuming is implicit.
+    cached_hashes = {row[0] for row in conn.execute("SELECT h FROM cache")}
+
+    # First pass: Collect segments that need generation. Normalize every
+    # text once into a flat list (reused by the planning loop below), then
+    # group slots per unique text with a single setdefault pass — the hot
+    # path stays in C-level list/dict operations rather than re-running
+    # normalize/hash/stat per subtitle. Each unique text is hashed exactly
+    # once; segments read their blob straight from the cache database, so
+    # there is no per-slot copy.
+    texts = [sub.text.replace('\n', ' ').strip() for sub in subs]
+    texts = ["" if t == "..." else t for t in texts]
+
+    text_to_indices = {}  # Map text -> segment indices needing its audio
+    for i, text in enumerate(texts):
+        if text:
+            text_to_indices.setdefault(text, []).append(i)
+    stats['empty'] += texts.count("")
+
+    text_hashes = {text: xxhash.xxh128(text.lower().encode('utf-8')).hexdigest()
+                   for text in text_to_indices}
+    segments_to_generate = [(text, text_hashes[text], indices[0])
+                            for text, indices in text_to_indices.items()
+                            if text_hashes[text] not in cached_hashes]
+    generating_texts = {text for text, _, _ in segments_to_generate}
+    stats['cached'] = sum(len(indices) for text, indices in text_to_indices.items()
+                          if text not in generating_texts)
+
     # Batch generate all needed segments in parallel
+    generation_errors = {}
     if segments_to_generate:
         unique_count = len(segments_to_generate)
-        total_needed = sum(1 for i, sub in enumerate(subs) 
-                          if not (resume and os.path.exists(os.path.join(temp_dir, f"raw_{i}.mp3"))))
-        deduped = total_needed - unique_count
-        
+        deduped = sum(len(text_to_indices[t]) - 1 for t, _, _ in segments_to_generate)
+
         if deduped > 0:
             logger.info(f"Deduplicated {deduped} identical text segments")
-        
+
         logger.info(f"Generating {unique_count} unique audio segments (batch size: {batch_size})...")
-        generation_errors = asyncio.run(generate_audio_batch(segments_to_generate, voice, batch_size, retries))
-        
-        # Copy cached files to segment locations and count results
-        for text, cache_path, idx in segments_to_generate:
-            raw_audio_path = os.path.join(temp_dir, f"raw_{idx}.mp3")
-            
+        generation_errors = asyncio.run(
+            generate_audio_batch(segments_to_generate, voice, conn, batch_size, retries))
+
+        # Count results; stretching reads the blobs directly from the cache
+        for text, text_hash, idx in segments_to_generate:
             if idx in generation_errors and generation_errors[idx] is None:
-                # Generation successful, copy from cache to raw location
-                try:
-                    import shutil
-                    if os.path.exists(cache_path):
-                        shutil.copy2(cache_path, raw_audio_path)
-                    stats['generated'] += 1
-                except Exception as e:
-                    logger.error(f"Failed to copy generated cache for segment {idx}: {e}")
-                    stats['failed'] += 1
+                stats['generated'] += 1
             else:
-                # Generation failed
                 stats['failed'] += 1
                 if idx in generation_errors:
                     logger.error(f"Failed to generate audio for segment {idx}: {generation_errors[idx]}")
-    # Now copy/deduplicate for all segments that need this text
-    logger.info("Copying cached audio to segment locations...")
-    for i, sub in enumerate(subs):
-        text = sub.text.replace('\n', ' ').strip()
-        if text == "...":
-            text = ""
-        if not text:
-            continue
-            
-        raw_audio_path = os.path.join(temp_dir, f"raw_{i}.mp3")
-        
-        # Skip if already exists (resumed)
-        if os.path.exists(raw_audio_path) and os.path.getsize(raw_audio_path) > 0:
-            continue
-        
-        # Get cache path for this text
-        import hashlib
-        text_hash = hashlib.md5(text.lower().encode('utf-8')).hexdigest()
-        cache_path = os.path.join(cache_dir, f"cache_{text_hash}.mp3")
-        
-        # Copy from cache to segment location
-        if os.path.exists(cache_path):
-            try:
-                import shutil
-                shutil.copy2(cache_path, raw_audio_path)
-            except Exception as e:
-                logger.error(f"Failed to copy cache to segment {i}: {e}")
-    
+
     logger.info("Processing and synchronizing segments...")
 
-    for i, sub in enumerate(tqdm(subs, desc="Processing", unit="sub")):
-        start_sec = time_str_to_seconds(sub.start)
-        end_sec = time_str_to_seconds(sub.end)
-        target_span_sec = end_sec - start_sec
-        text = sub.text.replace('\n', ' ').strip()
-        if text == "...":
-            text = ""
-        
+    # Serial planning pass: adjust_audio_length always returns exactly the
+    # requested sample count, so every segment's position and duration can
+    # be computed up front without touching any audio. The plan is a list
+    # of ('silence', n_samples) / ('segment', index) actions in timeline
+    # order; the actual stretching is CPU-bound and runs in parallel below.
+    plan = []
+    stretch_jobs = []  # (segment_index, cache_db_path, text_hash, target_samples, max_speed)
+    head_samples = 0
+    overlap_threshold_samples = int(OVERLAP_THRESHOLD * SAMPLE_RATE)
+    min_segment_samples = int(MIN_SEGMENT_DURATION * SAMPLE_RATE)
+
+    for i in range(len(subs)):
+        text = texts[i]
+
         # 1. Handle Pre-Gap (Silence before this sub)
-        current_head_sec = current_total_samples / SAMPLE_RATE
-        gap_sec = start_sec - current_head_sec
-        
-        if gap_sec > 0:
-            # Add silence
-            gap_samples = int(gap_sec * SAMPLE_RATE)
-            silence_chunk = np.zeros(gap_samples, dtype=np.float32)
-            audio_segments.append(silence_chunk)
-            current_total_samples += gap_samples
-            
-        elif gap_sec < -OVERLAP_THRESHOLD:
+        gap_samples = int(start_samples[i]) - head_samples
+
+        if gap_samples > 0:
+            plan.append(('silence', gap_samples))
+            head_samples += gap_samples
+
+        elif gap_samples < -overlap_threshold_samples:
             stats['overlaps'] += 1
-            logger.warning(f"Overlap at sub {i+1}: Head {current_head_sec:.2f}s > Start {start_sec:.2f}s")
+            logger.warning(f"Overlap at sub {i+1}: Head {head_samples / SAMPLE_RATE:.2f}s "
+                           f"> Start {start_samples[i] / SAMPLE_RATE:.2f}s")
             # We continue from where we are.
 
         if not text:
             stats['empty'] += 1
-            # Fill slot with silence to reach end_sec
-            current_head_sec = current_total_samples / SAMPLE_RATE
-            needed_sec = end_sec - current_head_sec
-            if needed_sec > 0:
-                needed_samples = int(needed_sec * SAMPLE_RATE)
-                audio_segments.append(np.zeros(needed_samples, dtype=np.float32))
-                current_total_samples += needed_samples
+            # Fill slot with silence to reach the subtitle's end
+            needed_samples = int(end_samples[i]) - head_samples
+            if needed_samples > 0:
+                plan.append(('silence', needed_samples))
+                head_samples += needed_samples
             continue
 
-        # 2. Get Generated Audio (already created in batch or from cache)
-        raw_audio_path = os.path.join(temp_dir, f"raw_{i}.mp3")
-        
-        # Check if generation failed
+        # 2. Check if generation failed
         if i in generation_errors and generation_errors[i] is not None:
             # Use silence as fallback for failed generation
             logger.debug(f"Using silence fallback for segment {i+1}")
-            needed_samples = int(target_span_sec * SAMPLE_RATE)
-            audio_segments.append(np.zeros(needed_samples, dtype=np.float32))
-            current_total_samples += needed_samples
+            needed_samples = int(end_samples[i] - start_samples[i])
+            plan.append(('silence', needed_samples))
+            head_samples += needed_samples
             continue
-            
-        # 3. Process & Fit
-        current_head_sec = current_total_samples / SAMPLE_RATE
-        target_dur_for_segment = end_sec - current_head_sec
-        
-        if target_dur_for_segment < MIN_SEGMENT_DURATION:
+
+        # 3. Plan the stretch to fit the remaining slot
+        target_samples_for_segment = int(end_samples[i]) - head_samples
+
+        if target_samples_for_segment < min_segment_samples:
             stats['late_starts'] += 1
             # We are late. Force max speed compression by requesting very small duration.
             logger.warning(f"  Sub {i+1} starts late. Forcing max speed catch-up.")
-            target_dur_for_segment = MIN_SEGMENT_DURATION 
-        
-        # Adjust audio
-        stretched_wav = adjust_audio_length(
-            raw_audio_path, 
-            target_dur_for_segment, 
-            sample_rate=SAMPLE_RATE, 
-            max_speed_factor=max_speed
-        )
-        
-        audio_segments.append(stretched_wav)
-        current_total_samples += len(stretched_wav)
-        
-    # 3. Final Padding (Ref Video)
-    if final_target_sec > 0:
-        current_len_sec = current_total_samples / SAMPLE_RATE
-        missing = final_target_sec - current_len_sec
-        
-        if missing > FINAL_PADDING_THRESHOLD:
-            logger.info(f"Adding final padding: {missing:.2f}s")
-            pad_samples = int(missing * SAMPLE_RATE)
-            audio_segments.append(np.zeros(pad_samples, dtype=np.float32))
-            current_total_samples += pad_samples
-        elif missing < -EXCESS_AUDIO_WARNING_THRESHOLD:
-            logger.warning(f"Total audio ({current_len_sec:.2f}s) exceeds target ({final_target_sec:.2f}s)!")
-            
-    # 4. Concatenate & Export
+            target_samples_for_segment = min_segment_samples
+
+        plan.append(('segment', i))
+        stretch_jobs.append((i, cache_db_path, text_hashes[text],
+                             target_samples_for_segment, max_speed))
+        head_samples += target_samples_for_segment
+
+    # Open the output sink before stretching: segments stream to disk in
+    # timeline order as they come back from the pool, so the full output
+    # never exists in memory and run length is bounded only by disk space.
+    writer = None
+    if not no_concat:
+        try:
+            output_ext = Path(output_path).suffix.lower().lstrip('.')
+        except:
+            output_ext = 'wav'
+        if output_ext in ['m4a', 'opus']:
+            logger.info(f"Streaming {output_ext} encode to {output_path} ...")
+            writer = _FfmpegStreamWriter(output_path, SAMPLE_RATE, output_ext)
+        else:
+            logger.info(f"Streaming final output to {output_path} ...")
+            writer = _WavStreamWriter(output_path, SAMPLE_RATE)
+
+    # Silence of any length streams as views of one reused zero block
+    zero_block = np.zeros(SAMPLE_RATE, dtype=np.float32)
+
+    def write_samples(chunk: npt.NDArray[np.float32]) -> None:
+        nonlocal current_total_samples
+        writer.write(chunk)
+        current_total_samples += len(chunk)
+
+    def write_silence(n_samples: int) -> None:
+        nonlocal current_total_samples
+        current_total_samples += n_samples
+        while n_samples > 0:
+            block = min(n_samples, len(zero_block))
+            writer.write(zero_block[:block])
+            n_samples -= block
+
+    # Parallel stretch: each job decodes + stretches one segment, which is
+    # pure CPU work with no shared state — scales with core count. Results
+    # arrive out of order; flush_ready drains the plan from the front as
+    # soon as each leading entry's audio is in hand, so only out-of-order
+    # completions are held in memory, never the whole timeline.
+    stretched = {}
+    plan_pos = 0
+
+    def flush_ready() -> None:
+        nonlocal plan_pos
+        while plan_pos < len(plan):
+            kind, value = plan[plan_pos]
+            if kind == 'silence':
+                write_silence(value)
+            elif value in stretched:
+                write_samples(stretched.pop(value))
+            else:
+                break
+            plan_pos += 1
+
+    if no_concat:
+        # Nothing is merged; the planner's head position is the exact
+        # total the summary below should report.
+        current_total_samples = head_samples
+    else:
+        if stretch_jobs:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+                futures = [pool.submit(_process_segment, job) for job in stretch_jobs]
+                for future in tqdm(as_completed(futures), total=len(futures),
+                                   desc="Processing", unit="sub"):
+                    idx, arr = future.result()
+                    stretched[idx] = arr
+                    flush_ready()
+        # Trailing silence entries (and all-silence plans) flush here
+        flush_ready()
+
+        # 3. Final Padding (Ref Video)
+        if final_target_sec > 0:
+            current_len_sec = current_total_samples / SAMPLE_RATE
+            missing = final_target_sec - current_len_sec
+
+            if missing > FINAL_PADDING_THRESHOLD:
+                logger.info(f"Adding final padding: {missing:.2f}s")
+                write_silence(int(missing * SAMPLE_RATE))
+            elif missing < -EXCESS_AUDIO_WARNING_THRESHOLD:
+                logger.warning(f"Total audio ({current_len_sec:.2f}s) exceeds target ({final_target_sec:.2f}s)!")
+
     logger.info("="*60)
     logger.info("Processing Summary:")
     logger.info(f"  Total segments: {stats['total']}")
     logger.info(f"  Generated: {stats['generated']}")
     logger.info(f"  Cached (text reuse): {stats['cached']}")
-    logger.info(f"  Resumed: {stats['resumed']}")
     logger.info(f"  Empty subtitles: {stats['empty']}")
     logger.info(f"  Failed (using silence): {stats['failed']}")
     if stats['overlaps'] > 0:
@@ -662,54 +959,38 @@ def srt_to_audio_numpy(
         logger.info(f"  Target match accuracy: {accuracy:.2f}%")
     logger.info("="*60)
     
-    # 4. Concatenate & Export
+    # 4. Export
     if no_concat:
         logger.info("Skipping concatenation (--no-concat mode)")
+        logger.info("Exporting individual segments from cache...")
+        for text, indices in text_to_indices.items():
+            row = conn.execute("SELECT data FROM cache WHERE h = ?",
+                               (text_hashes[text],)).fetchone()
+            if row is None:
+                continue
+            for idx in indices:
+                with open(os.path.join(temp_dir, f"raw_{idx}.wav"), 'wb') as f:
+                    f.write(row[0])
+        conn.close()
         logger.info(f"Individual segments saved in: {temp_dir}")
         logger.info("Done.")
         return
-    
-    logger.info("Concatenating segments...")
-    if audio_segments:
-        full_wav = np.concatenate(audio_segments)
-    else:
-        full_wav = np.zeros(0, dtype=np.float32)
-    
-    try:
-        output_ext = Path(output_path).suffix.lower().lstrip('.')
-    except:
-        output_ext = 'wav'
-    
-    if output_ext in ['m4a', 'opus']:
-        logger.info(f"Saving temporary WAV for conversion to {output_ext}...")
-        temp_output_wav = os.path.join(temp_dir, "final_output_temp.wav")
-        sf.write(temp_output_wav, full_wav, SAMPLE_RATE)
-        
-        logger.info(f"Converting to {output_ext}...")
-        if convert_audio_format(temp_output_wav, output_path, output_ext):
-            logger.info("Done.")
-        else:
-            logger.error("Conversion failed.")
-            
-        # Clean up temp wav
-        if os.path.exists(temp_output_wav):
-            try:
-                os.remove(temp_output_wav)
-            except: pass
-    else:
-        logger.info(f"Saving final output to {output_path} ...")
-        sf.write(output_path, full_wav, SAMPLE_RATE)
+
+    # Everything has already been streamed; closing finalizes the file
+    # (WAV header sizes patched in, or ffmpeg flushed and reaped).
+    if writer.close():
         logger.info("Done.")
-    
+    else:
+        logger.error("Encoding failed.")
+
     # Cleanup
+    if keep_temp:
+        cache_count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        logger.info(f"Cache preserved: {cache_count} unique text segments in {cache_db_path}")
+    conn.close()
     if not keep_temp and os.path.exists(temp_dir):
         shutil.rmtree(temp_dir)
         logger.info("Cleaned temp (including cache).")
-    elif keep_temp:
-        cache_dir = os.path.join(temp_dir, "cache")
-        if os.path.exists(cache_dir):
-            cache_count = len([f for f in os.listdir(cache_dir) if f.startswith('cache_')])
-            logger.info(f"Cache preserved: {cache_count} unique text segments in {cache_dir}")
 
 if __name__ == "__main__":
     # Print banner